@@ -1,11 +1,31 @@
 from django.apps import AppConfig
 import logging
+import threading
 import time
-from .matcher import SmartNameMatcher
+from .matcher import SmartNameMatcher, CACHE_FILENAME
 
 logger = logging.getLogger(__name__)
 
+# Seconds a request waits for a matcher that is still loading before giving up.
+MATCHER_READY_TIMEOUT = 60
+
 smart_matcher_instance = None
+_matcher_ready = threading.Event()
+_matcher_thread = None
+
+
+def _init_matcher():
+    """Builds the matcher in the background; always signals readiness, even on failure."""
+    global smart_matcher_instance
+    start_time = time.time()
+    try:
+        smart_matcher_instance = SmartNameMatcher(use_cache=True, cache_file=CACHE_FILENAME)
+        logger.info(f"SmartNameMatcher initialized successfully in {time.time() - start_time:.2f}s via AppConfig.")
+    except Exception as e:
+        logger.exception(f"CRITICAL ERROR: Failed to initialize SmartNameMatcher in AppConfig: {e}")
+    finally:
+        _matcher_ready.set()
+
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -14,25 +34,23 @@ class ApiConfig(AppConfig):
     def ready(self):
         """
         This method is called once when Django starts.
-        Initialize heavy resources here.
+        Heavy resources are initialized on a background thread so startup is not blocked.
         """
-        global smart_matcher_instance
+        global _matcher_thread
         
-        if not smart_matcher_instance:
-            logger.info("Django AppConfig ready: Initializing SmartNameMatcher instance...")
-            start_time = time.time()
-            try:
-                cache_file = "name_metaphone_cache.v1.pkl.gz"
-                smart_matcher_instance = SmartNameMatcher(use_cache=True, cache_file=cache_file)
-                logger.info(f"SmartNameMatcher initialized successfully in {time.time() - start_time:.2f}s via AppConfig.")
-            except Exception as e:
-                logger.exception(f"CRITICAL ERROR: Failed to initialize SmartNameMatcher in AppConfig: {e}")
+        if _matcher_thread is None:
+            logger.info("Django AppConfig ready: Initializing SmartNameMatcher instance in the background...")
+            _matcher_thread = threading.Thread(target=_init_matcher, name="smart-matcher-init", daemon=True)
+            _matcher_thread.start()
         else:
-             logger.info("SmartNameMatcher instance already initialized.")
+             logger.info("SmartNameMatcher instance already initialized or initializing.")
 
 
 def get_matcher_instance():
+    if not _matcher_ready.wait(timeout=MATCHER_READY_TIMEOUT):
+        logger.error(f"SmartNameMatcher still initializing after waiting {MATCHER_READY_TIMEOUT}s.")
+        raise RuntimeError("SmartNameMatcher is not available.")
     if smart_matcher_instance is None:
         logger.error("SmartNameMatcher instance requested before initialization or initialization failed!")
         raise RuntimeError("SmartNameMatcher is not available.")
-    return smart_matcher_instance
\ No newline at end of file
+    return smart_matcher_instance
@@ -1,13 +1,19 @@
+import functools
+import gc
+import heapq
+import math
 import time
 import os
 import pickle
-import gzip
 import logging
 from collections import defaultdict
-from typing import List, Dict, Optional, Set, Tuple, Union # Added Union
+from types import MappingProxyType
+from typing import List, Dict, FrozenSet, Mapping, Optional, Set, Tuple, Union # Added Union
 
+import numpy as np
 import pycountry
-from doublemetaphone import doublemetaphone
+import zstandard as zstd
+from doublemetaphone import doublemetaphone as _doublemetaphone
 from rapidfuzz import fuzz, process
 from names_dataset import NameDataset
 
@@ -20,7 +26,6 @@ logger = logging.getLogger(__name__)
 # Scoring Parameters
 NORDIC_NAME_BONUS = 5
 COUNTRY_MATCH_BONUS = 10 #! More relevant for first names?
-VARIANT_MATCH_BONUS = 15
 EXACT_QUERY_VARIANT_BONUS = 20
 COUNTRY_MISMATCH_PENALTY = 10
 POPULAR_THRESHOLD = 0.5
@@ -75,102 +80,173 @@ PATTERN_SUBSTITUTIONS = {
 }
 INITIAL_SUBSTITUTIONS = { "t": {"IS": "þ"} }
 NORDIC_COUNTRIES = {"SE", "DK", "NO", "IS", "FI"}
+NORDIC_CHARS = frozenset('åäöæøþÅÄÖÆØÞðÐ')
+# Letters that enable rule-based variants when the country is not Nordic
+RULE_TRIGGER_CHARS = frozenset("acdghklmnoprstuwxyz")
 
-# Cache configuration
-CACHE_FILENAME = "name_metaphone_cache.v1.pkl.gz"
-CACHE_VERSION = 1
+# Column layout of the per-name index arrays
+NAME_TYPES = ("first_name", "last_name")  # index = value stored in SmartNameMatcher.type_arr
+NAME_TYPE_CODES = {name_type: code for code, name_type in enumerate(NAME_TYPES)}
+NORDIC_COUNTRY_COLUMNS = {code: col for col, code in enumerate(("SE", "DK", "NO", "IS", "FI"))}  # columns of country_pop_u8
 
-# --- Global Initialization (Keep as before) ---
-try:
-    logger.info("Initializing NameDataset...")
-    ND_START_TIME = time.time()
-    ND_INSTANCE = NameDataset()
-    logger.info(f"NameDataset initialized in {time.time() - ND_START_TIME:.2f}s.")
-except Exception as e:
-    logger.error(f"Fatal Error: Failed to initialize NameDataset: {e}")
-    raise SystemExit(f"Could not initialize NameDataset: {e}")
+# Cache configuration
+CACHE_VERSION = 8
+CACHE_FILENAME = f"name_metaphone_cache.v{CACHE_VERSION}.pkl.zst"
+CACHE_COMPRESSION_LEVEL = 3
+# PICKLE_UNCOMPRESSED=1: store the cache as a plain protocol-5 pickle (".pkl") whose large NumPy buffers live
+# out-of-band in a ".buffers" sidecar that is memory-mapped on load. Faster cold start where disk is fast.
+PICKLE_UNCOMPRESSED = os.environ.get("PICKLE_UNCOMPRESSED") == "1"
+CACHE_BUFFER_MIN_BYTES = 64 * 1024  # smaller buffers stay in-band
+CACHE_BUFFER_ALIGNMENT = 64
+CACHE_TOKEN_BYTES = 16
+CACHE_KEYS = ('names', 'metaphone_to_ids', 'name_to_metaphone', 'type_arr', 'country_pop_u8', 'has_country_data', 'name_data', 'nordic_name_ids')
+
+# Search configuration
+SEARCH_RESULT_CACHE_SIZE = 10_000  # (query_name, name type, country, n, threshold) entries kept per matcher
+
+# --- Global Initialization ---
+def load_name_dataset() -> NameDataset:
+    """Loads NameDataset on demand; it is only needed when the index has to be (re)built."""
+    try:
+        logger.info("Initializing NameDataset...")
+        nd_start_time = time.time()
+        name_dataset = NameDataset()
+        logger.info(f"NameDataset initialized in {time.time() - nd_start_time:.2f}s.")
+        return name_dataset
+    except Exception as e:
+        logger.error(f"Fatal Error: Failed to initialize NameDataset: {e}")
+        raise RuntimeError(f"Could not initialize NameDataset: {e}") from e
 
 try:
-    COUNTRY_CODE_MAP = {country.alpha_2: country for country in pycountry.countries}
+    VALID_COUNTRY_CODES: frozenset = frozenset(country.alpha_2 for country in pycountry.countries)
 except Exception as e:
-    logger.error(f"Error initializing country code map: {e}")
-    COUNTRY_CODE_MAP = {}
+    logger.error(f"Error initializing country code set: {e}")
+    VALID_COUNTRY_CODES = frozenset()
 
 # --- Helper Functions ---
+def quantize_popularity(popularity: Union[float, np.ndarray]) -> Union[int, np.ndarray]:
+    """Maps a popularity share in [0, 1] to 1..255; 0 is reserved for 'country not listed'.
+
+    Rounds up, so q > quantize_popularity(t) holds exactly when the share is above t for any t on the 1/254 grid.
+    """
+    return 1 + np.ceil(np.clip(popularity, 0, 1) * 254).astype(np.uint8)
+
+POPULAR_THRESHOLD_U8 = int(quantize_popularity(POPULAR_THRESHOLD))
+
+# Query names and their rule variants repeat heavily across requests; indexing uses the raw function.
+doublemetaphone = functools.lru_cache(maxsize=8192)(_doublemetaphone)
+
+@functools.lru_cache(maxsize=512)
 def validate_country_code(country_code: Optional[str]) -> Optional[str]:
     if not country_code: return None
     code = country_code.upper()
-    if code in COUNTRY_CODE_MAP: return code
+    if code in VALID_COUNTRY_CODES: return code
     logger.warning(f"Invalid country code: {country_code}")
     return None
 
+def lexical_length_band(query_len: int, score_cutoff: float) -> Tuple[int, int]:
+    """Returns the (min, max) candidate length that can reach `score_cutoff` under fuzz.ratio.
+
+    fuzz.ratio(a, b) <= 200 * min(len) / (len(a) + len(b)), so names far shorter or longer
+    than the query can never clear the cutoff.
+    """
+    c = score_cutoff / 100
+    if c <= 0: return 0, math.inf
+    return math.ceil(query_len * c / (2 - c) - 1e-9), math.floor(query_len * (2 - c) / c + 1e-9)
+
+# A replacement's (lower, title, upper) forms, indexed by the `_case_key` of the source slice it replaces.
+CasedReplacement = Tuple[str, str, str]
+
+def _case_forms(replacement: str) -> CasedReplacement:
+    return (replacement.lower(), replacement[:1].upper() + replacement[1:].lower(), replacement.upper())
+
+def _case_key(source: str) -> int:
+    """0 (lower), 1 (title) or 2 (upper): how a replacement for `source` is cased to preserve its case."""
+    if source.istitle() or (source[0].isupper() and (len(source) == 1 or source[1:].islower())): return 1
+    if source.isupper(): return 2
+    return 0
+
+@functools.lru_cache(maxsize=None)
+def _compile_nordic_rules(country_code: Optional[str]) -> Tuple[Tuple[Tuple[int, Dict[str, Tuple[CasedReplacement, ...]]], ...], Dict[str, Tuple[CasedReplacement, ...]], Dict[str, Tuple[CasedReplacement, ...]]]:
+    """
+    Flattens the substitution tables for one (validated) country code, or None for all countries.
+
+    Returns (substitutions, patterns, initials): substitutions is a tuple of (length, {source: replacements})
+    ordered longest first, and every mapping only holds sources with at least one replacement valid
+    for the country, so variant generation is plain dict lookups. Replacements are stored as their
+    precomputed cased forms (see `_case_forms`).
+    """
+    by_length: Dict[int, Dict[str, Tuple[CasedReplacement, ...]]] = defaultdict(dict)
+    for source, sub_rule in COMPREHENSIVE_NORDIC_SUBSTITUTIONS.items():
+        rules_to_process = []
+        if isinstance(sub_rule, list): rules_to_process.extend(sub_rule)
+        elif isinstance(sub_rule, dict): rules_to_process.append(sub_rule)
+        elif isinstance(sub_rule, str): rules_to_process.append({'target': sub_rule})
+
+        possible_replacements = []
+        for rule_item in rules_to_process:
+            target = None; valid_for_country = True
+            if isinstance(rule_item, str): target = rule_item
+            elif isinstance(rule_item, dict):
+                target = rule_item.get("default") or rule_item.get("target")
+                countries = rule_item.get("countries"); exclude_countries = rule_item.get("exclude_countries")
+                if country_code:
+                    if countries and country_code not in countries: valid_for_country = False
+                    if exclude_countries and country_code in exclude_countries: valid_for_country = False
+            if valid_for_country and target and target not in possible_replacements: possible_replacements.append(target)
+        if possible_replacements: by_length[len(source)][source] = tuple(map(_case_forms, possible_replacements))
+    substitutions = tuple(sorted(by_length.items(), reverse=True))
+
+    def _for_country(sub_table: Dict[str, Dict[str, str]]) -> Dict[str, Tuple[CasedReplacement, ...]]:
+        compiled = {}
+        for source, sub_map in sub_table.items():
+            replacements = tuple(_case_forms(replacement) for country, replacement in sub_map.items() if not country_code or country_code == country)
+            if replacements: compiled[source] = replacements
+        return compiled
+
+    return substitutions, _for_country(PATTERN_SUBSTITUTIONS), _for_country(INITIAL_SUBSTITUTIONS)
+
 def generate_nordic_variants(name: str, country_code: Optional[str] = None) -> Set[str]:
     if not name: return set()
     results = {name}
     original_lower = name.lower()
     country_code = validate_country_code(country_code) if country_code else None
     name_len = len(name)
-
-    def _preserve_case(original_chars: str, replacement: str) -> str:
-        if not original_chars or not replacement: return replacement
-        if original_chars.istitle(): return replacement[0].upper() + replacement[1:].lower()
-        if original_chars.isupper(): return replacement.upper()
-        if original_chars[0].isupper() and (len(original_chars) == 1 or original_chars[1:].islower()): return replacement[0].upper() + replacement[1:].lower()
-        return replacement.lower()
+    substitutions, patterns, initials = _compile_nordic_rules(country_code)
 
     processed_indices = set()
-    possible_lengths = {len(k) for k in COMPREHENSIVE_NORDIC_SUBSTITUTIONS.keys()} | {1}
-    for length in sorted(possible_lengths, reverse=True):
+    for length, sub_table in substitutions:
         if length > name_len: continue
         for i in range(name_len - length + 1):
             if i in processed_indices: continue
-            source_chars_original = name[i : i + length]
-            source_chars_lower = original_lower[i : i + length]
-            if source_chars_lower in COMPREHENSIVE_NORDIC_SUBSTITUTIONS:
-                sub_rule = COMPREHENSIVE_NORDIC_SUBSTITUTIONS[source_chars_lower]
-                possible_replacements = []
-                rules_to_process = []
-                if isinstance(sub_rule, list): rules_to_process.extend(sub_rule)
-                elif isinstance(sub_rule, dict): rules_to_process.append(sub_rule)
-                elif isinstance(sub_rule, str): rules_to_process.append({'target': sub_rule})
-
-                for rule_item in rules_to_process:
-                    target = None; valid_for_country = True
-                    if isinstance(rule_item, str): target = rule_item
-                    elif isinstance(rule_item, dict):
-                        target = rule_item.get("default") or rule_item.get("target")
-                        countries = rule_item.get("countries"); exclude_countries = rule_item.get("exclude_countries")
-                        if country_code:
-                            if countries and country_code not in countries: valid_for_country = False
-                            if exclude_countries and country_code in exclude_countries: valid_for_country = False
-                    if valid_for_country and target: possible_replacements.append(target)
-
-                if possible_replacements:
-                    for replacement in set(possible_replacements):
-                        new_variant = name[:i] + _preserve_case(source_chars_original, replacement) + name[i + length:]
-                        results.add(new_variant)
-                    for j in range(length): processed_indices.add(i + j)
-
-    for i in range(name_len - 1):
-        pattern_lower = original_lower[i:i+2]
-        if pattern_lower in PATTERN_SUBSTITUTIONS:
-            sub_map = PATTERN_SUBSTITUTIONS[pattern_lower]
-            for country, replacement in sub_map.items():
-                if not country_code or country_code == country:
-                    original_segment = name[i:i+2]
-                    new_variant = name[:i] + _preserve_case(original_segment, replacement) + name[i+2:]
-                    results.add(new_variant)
-
-    if name and name[0].lower() in INITIAL_SUBSTITUTIONS:
-         first_char_lower = name[0].lower()
-         if 0 not in processed_indices:
-             sub_map = INITIAL_SUBSTITUTIONS.get(first_char_lower, {})
-             for country, replacement in sub_map.items():
-                if not country_code or country_code == country:
-                     new_variant = _preserve_case(name[0], replacement) + name[1:]
-                     results.add(new_variant)
+            replacements = sub_table.get(original_lower[i : i + length])
+            if replacements:
+                case_key = _case_key(name[i : i + length])
+                prefix, suffix = name[:i], name[i + length:]
+                for cased in replacements:
+                    results.add(f"{prefix}{cased[case_key]}{suffix}")
+                processed_indices.update(range(i, i + length))
+
+    if patterns:
+        for i in range(name_len - 1):
+            replacements = patterns.get(original_lower[i:i+2])
+            if replacements:
+                case_key = _case_key(name[i:i+2])
+                prefix, suffix = name[:i], name[i+2:]
+                for cased in replacements:
+                    results.add(f"{prefix}{cased[case_key]}{suffix}")
+
+    if initials and 0 not in processed_indices:
+        case_key = _case_key(name[0])
+        for cased in initials.get(name[0].lower(), ()):
+            results.add(cased[case_key] + name[1:])
     return results
 
+@functools.lru_cache(maxsize=4096)
+def _cached_nordic_variants(name: str, country_code: Optional[str]) -> FrozenSet[str]:
+    """LRU-cached generate_nordic_variants; popular query names stay resident."""
+    return frozenset(generate_nordic_variants(name, country_code))
+
 
 # --- SmartNameMatcher Class ---
 class SmartNameMatcher:
@@ -181,20 +257,31 @@ class SmartNameMatcher:
     def __init__(self, use_cache=True, cache_file=CACHE_FILENAME):
         logger.info("Initializing SmartNameMatcher...")
         start_time = time.time()
+        self.uncompressed_cache = PICKLE_UNCOMPRESSED
+        if self.uncompressed_cache and cache_file.endswith(".zst"): cache_file = cache_file[:-len(".zst")]
         self.cache_file = cache_file
-        self.variant_cache: Dict[str, Set[str]] = {}
-        self.metaphone_index: Dict[str, Set[str]] = defaultdict(set)
+        self.cache_buffers_file = f"{cache_file}.buffers"
+        # Struct-of-arrays index: names are addressed by their position in `self.names`.
+        self.names: List[str] = []
+        self.name_id: Dict[str, int] = {}
+        self.name_lower: List[str] = []
+        self.len_offsets: List[int] = []
+        self.metaphone_to_ids: Dict[str, np.ndarray] = {}
         self.name_to_metaphone: Dict[str, Tuple[str, str]] = {}
-        self.name_to_info: Dict[str, Dict] = {}
-        self.nordic_names: Set[str] = set()
-        self.all_indexed_names: Set[str] = set()
+        self.type_arr: np.ndarray = np.empty(0, dtype=np.uint8)  # NAME_TYPE_CODES per id
+        self.country_pop_u8: np.ndarray = np.empty((0, len(NORDIC_COUNTRY_COLUMNS)), dtype=np.uint8)  # see quantize_popularity
+        self.has_country_data: np.ndarray = np.empty(0, dtype=bool)
+        self.name_data: List[Dict] = []  # raw NameDataset record per id, returned with matches
+        self.nordic_name_ids: Set[int] = set()
+        # Per-instance LRU over fully scored results; the index is immutable once loaded, so entries never go stale.
+        self._cached_name_part_matches = functools.lru_cache(maxsize=SEARCH_RESULT_CACHE_SIZE)(self._compute_name_part_matches)
         loaded_from_cache = False
         if use_cache: loaded_from_cache = self._load_from_cache()
         if not loaded_from_cache:
             logger.info("Building index from NameDataset...")
-            self._build_index(ND_INSTANCE)
+            self._build_index(load_name_dataset())
             if use_cache: self._save_to_cache()
-        logger.info(f"SmartNameMatcher ready ({len(self.all_indexed_names)} names indexed). Init time: {time.time() - start_time:.2f}s.")
+        logger.info(f"SmartNameMatcher ready ({len(self.names)} names indexed). Init time: {time.time() - start_time:.2f}s.")
 
     # --- Cache and Index Building Methods ---
     # _load_from_cache, _save_to_cache, _build_index, _process_and_index_name
@@ -203,125 +290,209 @@ class SmartNameMatcher:
         if not os.path.exists(self.cache_file): return False
         logger.warning(f"Using cache: {self.cache_file}. Delete if data/rules changed (v{CACHE_VERSION}).")
         try:
-            with gzip.open(self.cache_file, 'rb') as f: cache_data = pickle.load(f)
+            # Unpickling creates millions of small objects; keep the cyclic GC from rescanning them repeatedly.
+            gc.disable()
+            try:
+                cache_data = self._read_cache_file()
+            finally:
+                gc.enable(); gc.collect()
             if cache_data.get('version') != CACHE_VERSION: logger.warning("Cache version mismatch."); return False
-            if not all(k in cache_data for k in ['metaphone_index', 'name_to_metaphone', 'name_to_info', 'nordic_names']): raise ValueError("Cache structure mismatch.")
-            self.metaphone_index = defaultdict(set); [self.metaphone_index[code].update(names) for code, names in cache_data.get('metaphone_index', {}).items()]
-            self.name_to_metaphone = cache_data.get('name_to_metaphone', {}); self.name_to_info = cache_data.get('name_to_info', {})
-            self.nordic_names = set(cache_data.get('nordic_names', [])); self.all_indexed_names = set(self.name_to_metaphone.keys())
-            logger.info(f"Loaded {len(self.all_indexed_names)} names from cache."); return True
+            if not all(k in cache_data for k in CACHE_KEYS): raise ValueError("Cache structure mismatch.")
+            self.names = cache_data['names']; self._build_name_columns()
+            self.metaphone_to_ids = cache_data['metaphone_to_ids']; self.name_to_metaphone = cache_data['name_to_metaphone']
+            self.type_arr = cache_data['type_arr']; self.country_pop_u8 = cache_data['country_pop_u8']
+            self.has_country_data = cache_data['has_country_data']; self.name_data = cache_data['name_data']
+            self.nordic_name_ids = set(cache_data.get('nordic_name_ids', []))
+            logger.info(f"Loaded {len(self.names)} names from cache."); return True
         except Exception as e:
             logger.error(f"Cache load error: {e}. Rebuilding."); self._clear_indexes(); return False
 
     def _save_to_cache(self):
         try:
             logger.info(f"Saving index to cache: {self.cache_file}...")
-            metaphone_index_list = {k: list(v) for k, v in self.metaphone_index.items()}
-            cache_data = {'version': CACHE_VERSION, 'metaphone_index': metaphone_index_list, 'name_to_metaphone': self.name_to_metaphone, 'name_to_info': self.name_to_info, 'nordic_names': list(self.nordic_names)}
-            with gzip.open(self.cache_file, 'wb') as f: pickle.dump(cache_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            cache_data = {'version': CACHE_VERSION, **{key: getattr(self, key) for key in CACHE_KEYS}}
+            cache_data['nordic_name_ids'] = list(self.nordic_name_ids)
+            gc.disable()
+            try:
+                self._write_cache_file(cache_data)
+            finally:
+                gc.enable(); gc.collect()
             logger.info("Cache saved.");
         except Exception as e: logger.error(f"Cache save error: {e}")
 
+    def _read_cache_file(self) -> Dict:
+        if not self.uncompressed_cache:
+            with open(self.cache_file, 'rb') as fh, zstd.ZstdDecompressor().stream_reader(fh) as f: return pickle.load(f)
+        # The file starts with a header {'token', 'size', 'layout': [(offset, nbytes), ...]} followed by the
+        # protocol-5 payload; out-of-band arrays are rebuilt as read-only views of the memory-mapped sidecar (no copy).
+        # The two files are replaced separately, so the sidecar must carry the same save token and size.
+        with open(self.cache_file, 'rb') as f:
+            header = pickle.load(f)
+            if not isinstance(header, dict): raise ValueError("Cache header mismatch.")
+            token = header['token']
+            sidecar = np.memmap(self.cache_buffers_file, dtype=np.uint8, mode='r')
+            if sidecar.size != header['size'] or sidecar[:len(token)].tobytes() != token:
+                raise ValueError("Cache buffers file does not belong to this cache file.")
+            buffers = [sidecar[offset:offset + nbytes] for offset, nbytes in header['layout']]
+            return pickle.load(f, buffers=buffers)
+
+    def _write_cache_file(self, cache_data: Dict):
+        # Write to temp files and swap them in, so a process stopped mid-save never leaves a truncated cache.
+        tmp_file = f"{self.cache_file}.tmp"
+        if not self.uncompressed_cache:
+            with open(tmp_file, 'wb') as fh, zstd.ZstdCompressor(level=CACHE_COMPRESSION_LEVEL, threads=-1).stream_writer(fh) as f: pickle.dump(cache_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.cache_file)
+            return
+
+        out_of_band: List[pickle.PickleBuffer] = []
+        def buffer_callback(buf: pickle.PickleBuffer) -> bool:
+            # Returning False moves the buffer out-of-band; small ones are cheaper inline.
+            if buf.raw().nbytes < CACHE_BUFFER_MIN_BYTES: return True
+            out_of_band.append(buf); return False
+        payload = pickle.dumps(cache_data, protocol=5, buffer_callback=buffer_callback)
+
+        # The sidecar starts with a random token identifying this save (checked on load).
+        token = os.urandom(CACHE_TOKEN_BYTES)
+        layout = []; offset = len(token)
+        tmp_buffers_file = f"{self.cache_buffers_file}.tmp"
+        with open(tmp_buffers_file, 'wb') as f:
+            f.write(token)
+            for buf in out_of_band:
+                raw = buf.raw(); padding = -offset % CACHE_BUFFER_ALIGNMENT
+                f.write(b"\0" * padding); offset += padding
+                layout.append((offset, raw.nbytes)); f.write(raw); offset += raw.nbytes
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({'token': token, 'size': offset, 'layout': layout}, f, protocol=5); f.write(payload)
+        os.replace(tmp_buffers_file, self.cache_buffers_file)
+        os.replace(tmp_file, self.cache_file)
+
     def _clear_indexes(self):
-         self.metaphone_index.clear(); self.name_to_metaphone.clear(); self.name_to_info.clear();
-         self.nordic_names.clear(); self.all_indexed_names.clear()
+         self.names = []; self.name_id = {}; self.name_lower = []; self.len_offsets = []; self.metaphone_to_ids = {}
+         self.name_to_metaphone.clear(); self.name_data = []
+         self.type_arr = np.empty(0, dtype=np.uint8); self.has_country_data = np.empty(0, dtype=bool)
+         self.country_pop_u8 = np.empty((0, len(NORDIC_COUNTRY_COLUMNS)), dtype=np.uint8)
+         self.nordic_name_ids.clear()
 
     def _build_index(self, name_dataset: NameDataset):
         self._clear_indexes()
+        name_info: Dict[str, Tuple[str, Dict]] = {}  # name -> (type_label, info) until ids are assigned
+        nordic_names: Set[str] = set()
         def process_dict(name_dict, type_label):
              count = 0; total = len(name_dict); logger.info(f"Processing {total} {type_label}s...")
-             for name, info in name_dict.items(): self._process_and_index_name(name, info, type_label); count += 1; #if count % 100000 == 0: logger.info(f"  {count}/{total} {type_label}s...")
+             for name, info in name_dict.items(): self._process_and_index_name(name, info, type_label, name_info, nordic_names); count += 1
              logger.info(f"Finished processing {count} {type_label}s.")
         process_dict(name_dataset.first_names, "first_name"); process_dict(name_dataset.last_names, "last_name")
-        self.all_indexed_names = set(self.name_to_metaphone.keys())
-
-    def _process_and_index_name(self, name: str, info: Dict, type_label: str):
-        if not name or not isinstance(name, str): 
+        self._assign_name_ids(name_info, nordic_names)
+
+    def _assign_name_ids(self, name_info: Dict[str, Tuple[str, Dict]], nordic_names: Set[str]):
+        """Assigns each indexed name an id and lays the indexes out as id-addressed columns."""
+        # Ordered by length so every length band is a contiguous id range (see len_offsets).
+        self.names = sorted(self.name_to_metaphone, key=lambda name: (len(name), name))
+        self._build_name_columns()
+        buckets: Dict[str, List[int]] = defaultdict(list)
+        for i, name in enumerate(self.names):
+            primary, secondary = self.name_to_metaphone[name]
+            if primary: buckets[primary].append(i)
+            if secondary and secondary != primary: buckets[secondary].append(i)
+        self.metaphone_to_ids = {code: np.array(ids, dtype=np.int32) for code, ids in buckets.items()}
+        self.nordic_name_ids = {self.name_id[name] for name in nordic_names}
+
+        n_names = len(self.names)
+        self.type_arr = np.fromiter((NAME_TYPE_CODES[name_info[name][0]] for name in self.names), dtype=np.uint8, count=n_names)
+        self.name_data = [name_info[name][1] for name in self.names]
+        country_popularity = np.full((n_names, len(NORDIC_COUNTRY_COLUMNS)), np.nan, dtype=np.float32)
+        self.has_country_data = np.zeros(n_names, dtype=bool)
+        for i, data in enumerate(self.name_data):
+            country_data = data.get('country')
+            if not isinstance(country_data, dict) or not country_data: continue
+            self.has_country_data[i] = True
+            for code, col in NORDIC_COUNTRY_COLUMNS.items():
+                if code in country_data: country_popularity[i, col] = country_data[code]
+        listed = ~np.isnan(country_popularity)
+        self.country_pop_u8 = np.where(listed, quantize_popularity(np.nan_to_num(country_popularity)), 0).astype(np.uint8)
+
+    def _build_name_columns(self):
+        """Derives the per-id lookup columns that are not stored in the cache."""
+        self.name_id = {name: i for i, name in enumerate(self.names)}
+        self.name_lower = [name.lower() for name in self.names]
+        # len_offsets[L] is the first id whose name has length >= L.
+        lengths = np.fromiter(map(len, self.names), dtype=np.int64, count=len(self.names))
+        max_len = int(lengths[-1]) if len(lengths) else 0
+        self.len_offsets = np.searchsorted(lengths, np.arange(max_len + 2), side='left').tolist()
+
+    def _process_and_index_name(self, name: str, info: Dict, type_label: str, name_info: Dict[str, Tuple[str, Dict]], nordic_names: Set[str]):
+        if not name or not isinstance(name, str):
             return
         name = name.strip()
         if not name: return
         try:
-            metaphone = doublemetaphone(name); self.name_to_metaphone[name] = metaphone; self.name_to_info[name] = {'type': type_label, 'data': info}
-            if metaphone[0]: self.metaphone_index[metaphone[0]].add(name)
-            if metaphone[1] and metaphone[1] != metaphone[0]: self.metaphone_index[metaphone[1]].add(name)
-            is_nordic = any(c in name for c in 'åäöæøþÅÄÖÆØÞðÐ')
+            metaphone = _doublemetaphone(name); self.name_to_metaphone[name] = metaphone; name_info[name] = (type_label, info)
+            is_nordic = not NORDIC_CHARS.isdisjoint(name)
             if not is_nordic and type_label == 'first_name' and isinstance(info.get('country'), dict):
                 if any(info['country'].get(c, 0) > 0.1 for c in NORDIC_COUNTRIES): is_nordic = True
-            if is_nordic: self.nordic_names.add(name)
-        except Exception as e: logger.warning(f"Skip name '{name}': {e}", exc_info=False)
+            if is_nordic: nordic_names.add(name)
+        except Exception as e:
+            logger.warning(f"Skip name '{name}': {e}", exc_info=False)
 
 
     # --- Search Logic ---
-    def _get_nordic_variants_cached(self, name: str, country_code: Optional[str]) -> Set[str]:
-        """Generates or retrieves cached Nordic variants for a query name."""
-        cache_key = f"{name}:{country_code or ''}"
-        if cache_key not in self.variant_cache:
-            self.variant_cache[cache_key] = generate_nordic_variants(name, country_code)
-            if len(self.variant_cache) > 1000: self.variant_cache.pop(next(iter(self.variant_cache)))
-        return self.variant_cache[cache_key]
-
-    def _get_candidates(self, query_name: str, n_lexical: int = 50) -> Set[str]:
-        """Retrieves candidate names using Metaphone and lexical similarity."""
-        candidates = set()
+    def _get_candidates(self, query_name: str, n_lexical: int = 50) -> np.ndarray:
+        """Retrieves candidate name ids (sorted, unique) using Metaphone and lexical similarity."""
         query_metaphone = doublemetaphone(query_name)
-        if query_metaphone[0]: candidates.update(self.metaphone_index.get(query_metaphone[0], set()))
-        if query_metaphone[1] and query_metaphone[1] != query_metaphone[0]: candidates.update(self.metaphone_index.get(query_metaphone[1], set()))
-        phonetic_count = len(candidates)
-        lexical_candidates = set()
-        if len(self.all_indexed_names) > 0:
-            lexical_matches = process.extract(query_name, self.all_indexed_names, scorer=fuzz.WRatio, limit=n_lexical, score_cutoff=LEXICAL_SEARCH_THRESHOLD)
-            lexical_candidates = {match[0] for match in lexical_matches}
-            candidates.update(lexical_candidates)
-        logger.debug(f"_get_candidates({query_name}): {phonetic_count} phonetic, {len(lexical_candidates)} lexical. Total: {len(candidates)}")
+        phonetic_ids = [self.metaphone_to_ids[code] for code in set(query_metaphone) if code and code in self.metaphone_to_ids]
+        phonetic_candidates = functools.reduce(np.union1d, phonetic_ids, np.empty(0, dtype=np.int32))
+        lexical_candidates = np.empty(0, dtype=np.int32)
+        if len(self.names) > 0:
+            # Only names whose length can still reach the cutoff are scored; ids in a band are contiguous.
+            min_len, max_len = lexical_length_band(len(query_name), LEXICAL_SEARCH_THRESHOLD)
+            last = len(self.len_offsets) - 1
+            start, stop = self.len_offsets[min(min_len, last)], self.len_offsets[min(max_len + 1, last)]
+            lexical_matches = process.extract(query_name.lower(), self.name_lower[start:stop], scorer=fuzz.QRatio, processor=None, limit=n_lexical, score_cutoff=LEXICAL_SEARCH_THRESHOLD)
+            lexical_candidates = np.fromiter((start + match[2] for match in lexical_matches), dtype=np.int32, count=len(lexical_matches))
+        candidates = np.union1d(phonetic_candidates, lexical_candidates)
+        logger.debug(f"_get_candidates({query_name}): {len(phonetic_candidates)} phonetic, {len(lexical_candidates)} lexical. Total: {len(candidates)}")
         return candidates
 
 
     def _score_candidate(self,
-                         cand_name: str,
+                         cand_id: int,
+                         base_similarity: float,
                          target_name_type: str, # 'first_name' or 'last_name'
-                         query_variants: Set[str],
-                         query_name: str,
+                         query_variant_ids: Set[int],
+                         query_name_lower: str,
                          country_code: Optional[str],
                          threshold: int) -> Optional[Dict]:
-        """Calculates the final score for a candidate name, filtering by type."""
-        if cand_name not in self.name_to_info: return None
-
-        info = self.name_to_info[cand_name]
-        # *** Filter by name type ***
-        if info.get('type') != target_name_type:
-            return None
+        """
+        Calculates the final score for a candidate name id of the target type that passed the base similarity gate.
+        `query_variant_ids` holds the ids of indexed query variants other than the query itself.
+        """
+        cand_name = self.names[cand_id]
 
         # --- Scoring logic ---
         metaphone = self.name_to_metaphone.get(cand_name, ("", ""))
-        cand_name_lower = cand_name.lower()
-        query_name_lower = query_name.lower()
-
-        base_similarity = max(fuzz.ratio(cand_name_lower, qv.lower()) for qv in query_variants)
-
-        required_base = threshold * BASE_SIMILARITY_THRESHOLD_FACTOR
-        if base_similarity < required_base:
-             return None
 
         final_score = base_similarity
         score_reasons = []
-        is_nordic_name = cand_name in self.nordic_names
-        is_exact_query_variant = cand_name != query_name and cand_name in query_variants
+        is_nordic_name = cand_id in self.nordic_name_ids
+        is_exact_query_variant = cand_id in query_variant_ids
 
-        if cand_name_lower == query_name_lower: final_score = max(100, final_score); score_reasons.append("Exact Match")
+        if self.name_lower[cand_id] == query_name_lower: final_score = max(100, final_score); score_reasons.append("Exact Match")
         if is_exact_query_variant: final_score += EXACT_QUERY_VARIANT_BONUS; score_reasons.append(f"+{EXACT_QUERY_VARIANT_BONUS} (Query Variant)")
         if is_nordic_name: final_score += NORDIC_NAME_BONUS; score_reasons.append(f"+{NORDIC_NAME_BONUS} (Nordic)")
 
-        if country_code:
-            data = info.get('data', {})
-            name_type = info.get('type', '') # Should match target_name_type
-            # Country bonus might be less relevant for last names, but apply for now
-            if name_type == 'first_name' and isinstance(data.get('country'), dict):
-                country_data = data['country']
-                if country_code in country_data:
-                    if country_data.get(country_code, 0) > POPULAR_THRESHOLD: final_score += COUNTRY_MATCH_BONUS; score_reasons.append(f"+{COUNTRY_MATCH_BONUS} (Popular:{country_code})")
-                elif country_data: final_score -= COUNTRY_MISMATCH_PENALTY; score_reasons.append(f"-{COUNTRY_MISMATCH_PENALTY} (Not in {country_code})")
-            elif name_type == 'nordic_variant' and data.get('country') == country_code:
-                 final_score += VARIANT_MATCH_BONUS; score_reasons.append(f"+{VARIANT_MATCH_BONUS} (Dataset Variant:{country_code})")
+        # Country bonus might be less relevant for last names, so it only applies to first names for now
+        if country_code and target_name_type == 'first_name' and self.has_country_data[cand_id]:
+            col = NORDIC_COUNTRY_COLUMNS.get(country_code)
+            if col is not None:
+                popularity_u8 = self.country_pop_u8[cand_id, col]
+                in_country = popularity_u8 != 0; is_popular = popularity_u8 > POPULAR_THRESHOLD_U8
+            else:
+                # Non-Nordic countries are not columnised; fall back to the raw record.
+                country_data = self.name_data[cand_id]['country']
+                in_country = country_code in country_data; is_popular = country_data.get(country_code, 0) > POPULAR_THRESHOLD
+            if in_country:
+                if is_popular: final_score += COUNTRY_MATCH_BONUS; score_reasons.append(f"+{COUNTRY_MATCH_BONUS} (Popular:{country_code})")
+            else: final_score -= COUNTRY_MISMATCH_PENALTY; score_reasons.append(f"-{COUNTRY_MISMATCH_PENALTY} (Not in {country_code})")
 
         final_score = min(final_score, 100)
 
@@ -329,7 +500,7 @@ class SmartNameMatcher:
             return {
                 'name': cand_name, 'score': round(final_score), 'base_similarity': round(base_similarity),
                 'metaphone': metaphone, 'is_nordic': is_nordic_name, 'is_query_variant': is_exact_query_variant,
-                'in_dataset': True, 'type': info.get('type', 'unknown'), 'data': info.get('data', {}),
+                'in_dataset': True, 'type': target_name_type, 'data': self.name_data[cand_id],
                 'score_reasons': score_reasons or ["Similarity Only"]
             }
         return None
@@ -340,46 +511,67 @@ class SmartNameMatcher:
                           country_code: Optional[str],
                           n: int,
                           threshold: int) -> List[Dict]:
-        """Internal helper to search for a single name part (first or last)."""
+        """Internal helper to search for a single name part (first or last); repeated queries are served from an LRU cache."""
         if not query_name: return []
 
-        scored_results = []
         try:
-            # 1. Generate Variants
-            use_nordic_rules = country_code in NORDIC_COUNTRIES or any(c in query_name.lower() for c in "acdghklmnoprstuwxyz")
-            query_variants = self._get_nordic_variants_cached(query_name, country_code) if use_nordic_rules else {query_name}
-
-            # 2. Get Candidates (all types initially)
-            candidates = self._get_candidates(query_name)
-
-            # 3. Score Candidates (filtering by target_name_type happens inside _score_candidate)
-            for cand_name in candidates:
-                scored_candidate = self._score_candidate(cand_name, target_name_type, query_variants, query_name, country_code, threshold)
-                if scored_candidate:
-                    scored_results.append(scored_candidate)
-
-            # 4. Add Rule-Generated Variants (if applicable and not already found)
-            # Check against scored results for THIS part only
-            dataset_matched_names = {res['name'] for res in scored_results}
-            if use_nordic_rules and RULE_VARIANT_SCORE >= threshold:
-                for qv in query_variants:
-                     if qv != query_name and qv not in self.name_to_info and qv not in dataset_matched_names:
-                          scored_results.append({
-                              'name': qv, 'score': RULE_VARIANT_SCORE, 'base_similarity': round(fuzz.ratio(qv.lower(), query_name.lower())),
-                              'metaphone': doublemetaphone(qv), 'is_nordic': True, 'is_query_variant': True, 'in_dataset': False,
-                              'type': 'rule_generated_variant', # Mark type clearly
-                              'data': {'source_query': query_name, 'target_type': target_name_type},
-                              'score_reasons': [f"Rule-Generated ({RULE_VARIANT_SCORE} base)"]
-                          })
-
-            # 5. Sort and Limit
-            scored_results.sort(key=lambda x: x['score'], reverse=True)
-            return scored_results[:n]
-
+            return [dict(match) for match in self._cached_name_part_matches(query_name, target_name_type, country_code, n, threshold)]
         except Exception as e:
             logger.exception(f"Error during _search_name_part for '{query_name}' ({target_name_type}): {e}")
             return []
 
+    def _compute_name_part_matches(self,
+                                   query_name: str,
+                                   target_name_type: str,
+                                   country_code: Optional[str],
+                                   n: int,
+                                   threshold: int) -> Tuple[Mapping[str, object], ...]:
+        """Uncached search for a single name part; wrapped per instance by `_cached_name_part_matches`."""
+        scored_results = []
+        # 1. Generate Variants
+        use_nordic_rules = country_code in NORDIC_COUNTRIES or not RULE_TRIGGER_CHARS.isdisjoint(query_name.lower())
+        query_variants = _cached_nordic_variants(query_name, country_code) if use_nordic_rules else frozenset((query_name,))
+
+        # 2. Get Candidates (all types initially)
+        candidates = self._get_candidates(query_name)
+        query_name_lower = query_name.lower()
+        name_id = self.name_id
+        query_variant_ids = {name_id[qv] for qv in query_variants if qv != query_name and qv in name_id}
+
+        # 3. Keep candidates of the target type, then compute base similarity for all of them in one batch
+        #    (best fuzz.ratio against any query variant) so weak candidates never reach _score_candidate.
+        cand_ids = candidates[self.type_arr[candidates] == NAME_TYPE_CODES[target_name_type]].tolist()
+        name_lower = self.name_lower
+        cand_lower = [name_lower[cand_id] for cand_id in cand_ids]
+        qv_lower = [qv.lower() for qv in query_variants]
+        base_scores = process.cdist(qv_lower, cand_lower, scorer=fuzz.ratio, workers=-1).max(axis=0) if cand_lower else []
+        required_base = threshold * BASE_SIMILARITY_THRESHOLD_FACTOR
+
+        # 4. Score the candidates that pass the base similarity gate
+        for cand_id, base_similarity in zip(cand_ids, base_scores):
+            if base_similarity < required_base: continue
+            scored_candidate = self._score_candidate(cand_id, float(base_similarity), target_name_type, query_variant_ids, query_name_lower, country_code, threshold)
+            if scored_candidate:
+                scored_results.append(scored_candidate)
+
+        # 5. Add Rule-Generated Variants (if applicable and not already found)
+        # Check against scored results for THIS part only
+        dataset_matched_names = {res['name'] for res in scored_results}
+        if use_nordic_rules and RULE_VARIANT_SCORE >= threshold:
+            for qv in query_variants:
+                 if qv != query_name and qv not in name_id and qv not in dataset_matched_names:
+                      scored_results.append({
+                          'name': qv, 'score': RULE_VARIANT_SCORE, 'base_similarity': round(fuzz.ratio(qv.lower(), query_name_lower)),
+                          'metaphone': doublemetaphone(qv), 'is_nordic': True, 'is_query_variant': True, 'in_dataset': False,
+                          'type': 'rule_generated_variant', # Mark type clearly
+                          'data': {'source_query': query_name, 'target_type': target_name_type},
+                          'score_reasons': [f"Rule-Generated ({RULE_VARIANT_SCORE} base)"]
+                      })
+
+        # 6. Sort and Limit; entries are frozen because they are shared by every hit on the cache
+        top_results = heapq.nlargest(n, scored_results, key=lambda x: x['score'])
+        return tuple(MappingProxyType(match) for match in top_results)
+
 
     def smart_search(self,
                      first_name: Optional[str] = None,
@@ -449,12 +641,12 @@ class SmartNameMatcher:
 
     def get_name_details(self, name: str) -> Optional[Dict]:
         """Retrieves detailed information for a specific name if indexed."""
-        if name in self.name_to_info:
-            info = self.name_to_info[name]
+        name_id = self.name_id.get(name)
+        if name_id is not None:
             return {
                 'name': name, 'metaphone': self.name_to_metaphone.get(name, ("", "")),
-                'type': info.get('type', 'unknown'), 'is_nordic': name in self.nordic_names,
-                'in_dataset': True, 'data': info.get('data', {})
+                'type': NAME_TYPES[self.type_arr[name_id]], 'is_nordic': name_id in self.nordic_name_ids,
+                'in_dataset': True, 'data': self.name_data[name_id]
             }
         logger.debug(f"Name '{name}' not found in index for get_name_details.")
         return None
@@ -0,0 +1,21 @@
+# api/renderers.py
+import orjson
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    JSON renderer backed by orjson, a drop-in for DRF's JSONRenderer on API responses.
+    NumPy scalars/arrays serialize natively; anything orjson does not know (lazy strings,
+    Decimals, ...) falls back to DRF's own JSONEncoder.
+    """
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+    _fallback_encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return orjson.dumps(data, default=self._fallback_encoder.default, option=orjson.OPT_SERIALIZE_NUMPY)
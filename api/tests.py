@@ -1,3 +1,39 @@
-from django.test import TestCase
+import itertools
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .matcher import _case_forms, _case_key, _compile_nordic_rules, generate_nordic_variants
+
+
+def _reference_preserve_case(original_chars, replacement):
+    """Case rule of the original per-call implementation; the precomputed forms must reproduce it."""
+    if not original_chars or not replacement: return replacement
+    if original_chars.istitle(): return replacement[0].upper() + replacement[1:].lower()
+    if original_chars.isupper(): return replacement.upper()
+    if original_chars[0].isupper() and (len(original_chars) == 1 or original_chars[1:].islower()): return replacement[0].upper() + replacement[1:].lower()
+    return replacement.lower()
+
+
+class NordicVariantCaseTests(SimpleTestCase):
+    def test_case_forms_match_reference_for_every_rule_and_casing(self):
+        substitutions, patterns, initials = _compile_nordic_rules(None)
+        tables = [sub_table for _, sub_table in substitutions] + [patterns, initials]
+        for sub_table in tables:
+            for source, replacements in sub_table.items():
+                # Every upper/lower combination of the source slice, e.g. sch, Sch, SCh, ScH, SCH, ...
+                for cased_source in map(''.join, itertools.product(*({c.lower(), c.upper()} for c in source))):
+                    for cased in replacements:
+                        self.assertEqual(cased[_case_key(cased_source)], _reference_preserve_case(cased_source, cased[0]),
+                                         f"{cased_source!r} -> {cased[0]!r}")
+
+    def test_case_forms(self):
+        self.assertEqual(_case_forms("kr"), ("kr", "Kr", "KR"))
+        self.assertEqual([_case_key(s) for s in ("sch", "Sch", "SCH", "SCh", "ScH", "sCH", "T", "t")], [0, 1, 2, 0, 0, 0, 1, 0])
+
+    def test_generate_nordic_variants(self):
+        self.assertEqual(generate_nordic_variants("Schmidt", "DK"), {"Schmidt", "Skmidt"})
+        self.assertEqual(generate_nordic_variants("SCHMIDT", "DK"), {"SCHMIDT", "SKMIDT"})
+        self.assertEqual(generate_nordic_variants("SChmidt", "DK"), {"SChmidt", "skmidt"})
+        self.assertEqual(generate_nordic_variants("Aase", "DK"), {"Aase", "Åse"})
+        self.assertEqual(generate_nordic_variants("THOR", "NO"), {"THOR", "THØR", "TOR"})
+        self.assertEqual(generate_nordic_variants("", "SE"), set())
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework import status
 import logging
 from .apps import get_matcher_instance
+from .renderers import ORJSONRenderer
 from .serializers import NameCorrectionRequestSerializer
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,8 @@ class NameCorrectionView(APIView):
     API endpoint to get corrections/suggestions for Scandinavian names.
     Accepts POST requests with 'first_name', 'last_name', and 'country_code'.
     """
+    renderer_classes = [ORJSONRenderer]
+
     def post(self, request, *args, **kwargs):
         """Handles POST request for name correction."""
         serializer = NameCorrectionRequestSerializer(data=request.data)